@@ -1,26 +1,87 @@
 from fastapi import APIRouter, Request, HTTPException
 from authlib.integrations.starlette_client import OAuth
-import os
+import httpx
+import logging
+import orjson
+from app.core.cache import get_redis
 from app.core.config import get_settings
 
 router = APIRouter()
 settings = get_settings()
 oauth = OAuth()
 
-oauth.register(
-    name="google",
-    client_id=settings.google_client_id,
-    client_secret=settings.google_client_secret,
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
+
+class _SharedTransport(httpx.AsyncHTTPTransport):
+    """
+    Authlib opens (and closes) a new httpx client for every token exchange.
+    Sharing one transport whose close is a no-op keeps the connection pool
+    to Google alive across logins.
+    """
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+_OAUTH_TRANSPORT = _SharedTransport(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20),
 )
 
+GOOGLE_METADATA_URL = "https://accounts.google.com/.well-known/openid-configuration"
+_METADATA_CACHE_KEY = "oauth:google:openid-configuration"
+_METADATA_TTL_SECONDS = 24 * 3600
+
+
+async def _load_google_metadata() -> dict:
+    """Google's OpenID discovery document, shared across workers via Redis."""
+    r = get_redis()
+    if r is not None:
+        cached = await r.get(_METADATA_CACHE_KEY)
+        if cached:
+            return orjson.loads(cached)
+
+    async with httpx.AsyncClient(transport=_OAUTH_TRANSPORT, timeout=10.0) as client:
+        resp = await client.get(GOOGLE_METADATA_URL)
+        resp.raise_for_status()
+
+    if r is not None:
+        await r.set(_METADATA_CACHE_KEY, resp.content, ex=_METADATA_TTL_SECONDS)
+    return orjson.loads(resp.content)
+
+
+async def register_google_oauth() -> None:
+    """
+    Register the Google client at startup with pre-loaded server metadata, so the
+    first login doesn't pay for the discovery fetch. Falls back to lazy discovery
+    (server_metadata_url) if the metadata can't be loaded.
+    """
+    log = logging.getLogger("uvicorn.error")
+    try:
+        metadata = await _load_google_metadata()
+    except Exception as e:
+        log.warning("Could not preload Google OpenID metadata, using lazy discovery: %s", e)
+        metadata = {"server_metadata_url": GOOGLE_METADATA_URL}
+
+    oauth.register(
+        name="google",
+        client_id=settings.google_client_id,
+        client_secret=settings.google_client_secret,
+        client_kwargs={
+            "scope": "openid email profile",
+            "transport": _OAUTH_TRANSPORT,
+            "timeout": 10.0,
+        },
+        **metadata,
+    )
+
 @router.get("/auth/google/login", tags=["auth"])
 async def google_login(request: Request):
-    base_url = os.getenv("BASE_URL")
-    if not base_url:
+    if not settings.base_url:
         raise HTTPException(status_code=500, detail="BASE_URL not configured")
-    redirect_uri = f"{base_url}/v1/auth/google/callback"
+    redirect_uri = f"{settings.base_url}/v1/auth/google/callback"
     return await oauth.google.authorize_redirect(request, redirect_uri)
 
 @router.get("/auth/google/callback", tags=["auth"])
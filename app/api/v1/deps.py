@@ -1,6 +1,12 @@
 from fastapi import Depends, HTTPException, Request
 
-def require_user(request: Request):
+async def require_user(request: Request):
+    # Session middleware is only mounted under SESSION_PATH_PREFIXES (app/main.py)
+    if "session" not in request.scope:
+        raise RuntimeError(
+            f"require_user used on {request.url.path}, which has no session middleware; "
+            "add its prefix to SESSION_PATH_PREFIXES in app/main.py"
+        )
     if not request.session.get("user"):
         raise HTTPException(status_code=401, detail="Not authenticated")
     return request.session["user"]
@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+import orjson
+from fastapi import APIRouter, Response
 from app.core.config import get_settings
 
 router = APIRouter()
@@ -8,8 +9,7 @@ def _mask(v: str | None) -> str | None:
         return None
     return f"present(len={len(v)})"
 
-@router.get("/env", tags=["meta"])
-def env():
+def _build_env() -> dict:
     s = get_settings()
     return {
         "env": {
@@ -22,3 +22,10 @@ def env():
             "AZURE_SEARCH_KEY": "present" if s.azure_search_key else None,
         }
     }
+
+# Settings are immutable after startup, so the masked payload is serialized once.
+_ENV_BODY = orjson.dumps(_build_env())
+
+@router.get("/env", tags=["meta"])
+async def env():
+    return Response(content=_ENV_BODY, media_type="application/json")
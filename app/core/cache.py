@@ -0,0 +1,21 @@
+from functools import lru_cache
+from typing import Optional
+import redis.asyncio as aioredis
+from app.core.config import get_settings
+
+@lru_cache(maxsize=1)
+def get_redis() -> Optional[aioredis.Redis]:
+    """
+    Shared Redis client built from REDIS_URL.
+    Returns None when Redis is not configured (local dev).
+    """
+    s = get_settings()
+    if not s.redis_url:
+        return None
+    return aioredis.from_url(s.redis_url)
+
+async def close_redis() -> None:
+    """Close the shared client's connections (shutdown); it reconnects lazily if reused."""
+    r = get_redis()
+    if r is not None:
+        await r.aclose()
@@ -1,6 +1,6 @@
+from functools import cached_property
 from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from functools import lru_cache
 
 class Settings(BaseSettings):
     app_name: str = "Context Search AI V2"
@@ -15,11 +15,35 @@ class Settings(BaseSettings):
     azure_search_endpoint: str | None = None
     azure_search_key: str | None = None
 
+    # Stripe (API key for outbound calls, signing secret for the webhook)
+    stripe_api_key: str = ""
+    stripe_webhook_secret: str = ""
+
+    # Public base URL (OAuth redirect target)
+    base_url: str | None = None
+
+    # Firestore (base64 of the service account JSON; falls back to ADC when empty)
+    firestore_sa_b64: str = ""
+    firestore_project_id: str | None = None
+
+    # Redis (shared state across workers)
+    redis_url: str | None = None
+
     # CORS
     cors_origins: str = "*"  # comma-separated if needed
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
-@lru_cache
+    @cached_property
+    def cors_origins_list(self) -> tuple[str, ...]:
+        return tuple(o.strip() for o in self.cors_origins.split(",") if o.strip())
+
+    @cached_property
+    def allow_all_origins(self) -> bool:
+        return "*" in self.cors_origins_list
+
+# Built once at import; settings are immutable for the life of the process.
+SETTINGS: Settings = Settings()
+
 def get_settings() -> Settings:
-    return Settings()
+    return SETTINGS
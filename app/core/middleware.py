@@ -0,0 +1,25 @@
+from typing import Callable, Sequence
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+class PathScopedMiddleware:
+    """
+    Run a middleware stack only for HTTP requests whose path starts with one of
+    `prefixes`; every other request goes straight to the wrapped app.
+    `middleware` receives the inner app and returns the wrapped ASGI app.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        middleware: Callable[[ASGIApp], ASGIApp],
+        prefixes: Sequence[str],
+    ) -> None:
+        self.app = app
+        self.scoped = middleware(app)
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.prefixes):
+            await self.scoped(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
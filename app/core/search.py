@@ -1,26 +1,61 @@
+from functools import lru_cache
 from typing import Optional
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from app.core.config import get_settings
 
 INDEX_NAME = "docs-v1"
 
-def get_index_client() -> SearchIndexClient:
+# Clients are cached so the underlying HTTP pipeline (and its keep-alive
+# connections to *.search.windows.net) is reused across requests.
+
+def _require_search_settings() -> tuple[str, str]:
     s = get_settings()
     if not s.azure_search_endpoint or not s.azure_search_key:
         raise RuntimeError("Azure Search not configured.")
+    return s.azure_search_endpoint, s.azure_search_key
+
+@lru_cache(maxsize=1)
+def get_index_client() -> SearchIndexClient:
+    endpoint, key = _require_search_settings()
     return SearchIndexClient(
-        endpoint=s.azure_search_endpoint,
-        credential=AzureKeyCredential(s.azure_search_key),
+        endpoint=endpoint,
+        credential=AzureKeyCredential(key),
     )
 
-def get_search_client(index_name: Optional[str] = None) -> SearchClient:
-    s = get_settings()
-    if not s.azure_search_endpoint or not s.azure_search_key:
-        raise RuntimeError("Azure Search not configured.")
+@lru_cache(maxsize=8)
+def _search_client(index_name: str) -> SearchClient:
+    endpoint, key = _require_search_settings()
     return SearchClient(
-        endpoint=s.azure_search_endpoint,
-        index_name=index_name or INDEX_NAME,
-        credential=AzureKeyCredential(s.azure_search_key),
+        endpoint=endpoint,
+        index_name=index_name,
+        credential=AzureKeyCredential(key),
     )
+
+def get_search_client(index_name: Optional[str] = None) -> SearchClient:
+    return _search_client(index_name or INDEX_NAME)
+
+# Async clients hold an aiohttp session tied to the running loop, so they are
+# kept in a plain dict that close_async_search_clients() empties on shutdown.
+_async_clients: dict[str, AsyncSearchClient] = {}
+
+def get_async_search_client(index_name: Optional[str] = None) -> AsyncSearchClient:
+    index_name = index_name or INDEX_NAME
+    client = _async_clients.get(index_name)
+    if client is None:
+        endpoint, key = _require_search_settings()
+        client = AsyncSearchClient(
+            endpoint=endpoint,
+            index_name=index_name,
+            credential=AzureKeyCredential(key),
+        )
+        _async_clients[index_name] = client
+    return client
+
+async def close_async_search_clients() -> None:
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.close()
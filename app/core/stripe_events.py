@@ -0,0 +1,57 @@
+from typing import Optional, Union
+import msgspec
+
+# Typed views of the Stripe webhook fields we actually read. msgspec decodes
+# straight into these and skips every other field without building dicts.
+
+class EventHeader(msgspec.Struct):
+    id: str
+    type: str
+
+class BillingDetails(msgspec.Struct):
+    email: Optional[str] = None
+
+class PaymentMethod(msgspec.Struct):
+    billing_details: Optional[BillingDetails] = None
+
+class CustomerDetails(msgspec.Struct):
+    email: Optional[str] = None
+
+class CheckoutSession(msgspec.Struct, tag_field="object", tag="checkout.session"):
+    customer: Optional[str] = None
+    subscription: Optional[str] = None
+    status: Optional[str] = None
+    customer_details: Optional[CustomerDetails] = None
+
+class Subscription(msgspec.Struct, tag_field="object", tag="subscription"):
+    id: Optional[str] = None
+    customer: Optional[str] = None
+    status: Optional[str] = None
+    # An id unless expanded
+    default_payment_method: Union[str, PaymentMethod, None] = None
+
+class Invoice(msgspec.Struct, tag_field="object", tag="invoice"):
+    id: Optional[str] = None
+    customer: Optional[str] = None
+    status: Optional[str] = None
+    default_payment_method: Union[str, PaymentMethod, None] = None
+
+class EventData(msgspec.Struct):
+    # Tagged on Stripe's own "object" field
+    object: Union[CheckoutSession, Subscription, Invoice]
+
+class StripeEvent(msgspec.Struct):
+    id: str
+    type: str
+    data: EventData
+
+_header_decoder = msgspec.json.Decoder(EventHeader)
+_event_decoder = msgspec.json.Decoder(StripeEvent)
+
+def decode_header(payload: bytes) -> EventHeader:
+    """Just id + type; validates the JSON but allocates nothing for data.object."""
+    return _header_decoder.decode(payload)
+
+def decode_event(payload: bytes) -> StripeEvent:
+    """Full typed decode; only valid for event types whose object is modelled above."""
+    return _event_decoder.decode(payload)
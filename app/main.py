@@ -1,13 +1,25 @@
-import os
-import json
+import hmac
+import time
 import base64
+import asyncio
+import hashlib
 import logging
-from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager, suppress
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
+import msgspec
+import orjson
 import stripe
-from fastapi import FastAPI, Depends, Request, HTTPException, BackgroundTasks
+from cachetools import TTLCache
+from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.sessions import SessionMiddleware
+from starsessions import SessionAutoloadMiddleware
+from starsessions import SessionMiddleware as RedisSessionMiddleware
+from starsessions.stores.redis import RedisStore
+from starlette.types import ASGIApp
 
 from google.cloud import firestore  # type: ignore
 from google.oauth2 import service_account  # type: ignore
@@ -17,133 +29,505 @@ from app.api.v1.search_admin import router as search_admin_router
 from app.api.v1.search_public import router as search_public_router
 from app.api.v1.search_ingest import router as search_ingest_router
 from app.api.v1.routes import router as v1_router
-from app.api.v1.auth_google import router as google_router
+from app.api.v1.auth_google import router as google_router, register_google_oauth
+from app.core.cache import close_redis, get_redis
 from app.core.config import get_settings
 from app.core.logging import setup_logging
+from app.core.middleware import PathScopedMiddleware
+from app.core.search import close_async_search_clients
+from app.core.stripe_events import (
+    CheckoutSession, Invoice, PaymentMethod, Subscription, decode_event, decode_header
+)
 
 
+log = logging.getLogger("uvicorn.error")
+
 # -----------------------------
 # Firestore client helper
 # -----------------------------
-_firestore_client: Optional[firestore.Client] = None
-
+@lru_cache(maxsize=1)
 def get_firestore_client() -> firestore.Client:
     """
     Build a Firestore client from FIRESTORE_SA_B64 (base64 of the service account JSON).
     Falls back to ADC if the var is missing (but we expect it to be present in Azure env).
+    Memoized so every webhook reuses the same client (and its gRPC channel).
     """
-    global _firestore_client
-    if _firestore_client is not None:
-        return _firestore_client
-
-    log = logging.getLogger("uvicorn.error")
-    b64 = os.getenv("FIRESTORE_SA_B64", "")
-    project_id = os.getenv("FIRESTORE_PROJECT_ID")
+    settings = get_settings()
+    b64 = settings.firestore_sa_b64
+    project_id = settings.firestore_project_id
 
     if not b64:
         log.warning("FIRESTORE_SA_B64 is not set; attempting ADC for Firestore")
-        _firestore_client = firestore.Client(project=project_id) if project_id else firestore.Client()
-        return _firestore_client
+        return firestore.Client(project=project_id) if project_id else firestore.Client()
 
     try:
-        info = json.loads(base64.b64decode(b64).decode("utf-8"))
+        info = orjson.loads(base64.b64decode(b64))  # orjson takes bytes; no str copy
         creds = service_account.Credentials.from_service_account_info(info)
         if not project_id:
             project_id = info.get("project_id")
         if not project_id:
             raise RuntimeError("No FIRESTORE_PROJECT_ID and no project_id in SA JSON.")
-        _firestore_client = firestore.Client(project=project_id, credentials=creds)
+        client = firestore.Client(project=project_id, credentials=creds)
         log.info("Firestore client initialized for project %s", project_id)
-        return _firestore_client
+        return client
     except Exception as e:
         log.exception("Failed to initialize Firestore client: %s", e)
         raise
 
 
-def write_customer_subscription_snapshot(
+@lru_cache(maxsize=1)
+def _subscriptions_collection() -> firestore.CollectionReference:
+    return get_firestore_client().collection("subscriptions")
+
+
+# Static parts of the snapshot documents; copied and filled in per write.
+_CUSTOMER_DOC_TEMPLATE: Dict[str, Any] = {"updatedAt": firestore.SERVER_TIMESTAMP}
+_EVENT_DOC_TEMPLATE: Dict[str, Any] = {"createdAt": firestore.SERVER_TIMESTAMP}
+
+
+# Buffered writes: webhook handlers only enqueue, a single drainer task commits
+# them in batches (one Firestore round trip per flush instead of per event).
+# The queue itself is created per app in lifespan (app.state.snapshot_queue), so
+# it is always bound to the event loop that serves the app.
+# (customer_id, cust_doc, event_id, evt_doc, raw_bytes); raw_bytes approximates the write size
+SnapshotWrite = Tuple[str, Dict[str, Any], str, Dict[str, Any], int]
+SnapshotQueue = asyncio.Queue[SnapshotWrite]
+
+_FLUSH_INTERVAL_SECONDS = 0.1
+_FLUSH_MAX_EVENTS = 250  # 2 writes per event -> stays under Firestore's 500-op batch limit
+_FLUSH_MAX_BYTES = 8 * 1024 * 1024  # headroom under Firestore's 10 MiB request limit
+# Bounded so slow commits push back on the event workers instead of growing memory
+SNAPSHOT_QUEUE_MAXSIZE = 2 * _FLUSH_MAX_EVENTS
+
+
+async def write_customer_subscription_snapshot(
+    snapshots: SnapshotQueue,
     customer_id: str,
     email: Optional[str],
     subscription_id: Optional[str],
     status: Optional[str],
-    raw: Dict[str, Any],
+    raw: bytes,
 ) -> None:
     """
-    Upsert a customer subscription snapshot into:
+    Queue an upsert of a customer subscription snapshot into:
       subscriptions/{customer_id}
         - email
         - lastSubscriptionId
         - lastStatus
         - updatedAt (server timestamp)
       subscriptions/{customer_id}/events/{stripe_event_id}
-        - raw event/object for auditing
+        - raw event/object for auditing (`raw` is the verified webhook body)
+    The write goes onto `snapshots` and is committed by the drainer task
+    (see drain_snapshot_queue); waits while the queue is full.
+    """
+    # The full dict is only kept for the Firestore audit copy
+    raw_event = orjson.loads(raw)
+    # We’ll store the 'raw' under events with the Stripe event id if present
+    event_id = raw_event.get("id") or raw_event.get("latest_invoice") or "no_event_id"
+
+    cust_doc = _CUSTOMER_DOC_TEMPLATE.copy()
+    cust_doc["email"] = email
+    cust_doc["lastSubscriptionId"] = subscription_id
+    cust_doc["lastStatus"] = status
+    evt_doc = _EVENT_DOC_TEMPLATE.copy()
+    evt_doc["raw"] = raw_event
+
+    await snapshots.put((customer_id, cust_doc, str(event_id), evt_doc, len(raw)))
+
+
+def _split_snapshot_batches(items: List[SnapshotWrite]) -> List[List[SnapshotWrite]]:
+    """Chunk items so each WriteBatch stays under _FLUSH_MAX_EVENTS and _FLUSH_MAX_BYTES."""
+    batches: List[List[SnapshotWrite]] = []
+    current: List[SnapshotWrite] = []
+    current_bytes = 0
+    for item in items:
+        size = item[4]
+        if current and (len(current) >= _FLUSH_MAX_EVENTS or current_bytes + size > _FLUSH_MAX_BYTES):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(item)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _write_snapshot_batch(items: List[SnapshotWrite]) -> int:
+    """Commit items as one WriteBatch; returns the number of customers written. Raises on failure."""
+    # Coalesce customer docs: with merge=True, later events simply overwrite fields
+    customers: Dict[str, Dict[str, Any]] = {}
+    for customer_id, cust_doc, _, _, _ in items:
+        customers.setdefault(customer_id, {}).update(cust_doc)
+
+    subscriptions = _subscriptions_collection()
+    batch = get_firestore_client().batch()
+    cust_refs = {}
+    for customer_id, cust_doc in customers.items():
+        cust_refs[customer_id] = cust_ref = subscriptions.document(customer_id)
+        batch.set(cust_ref, cust_doc, merge=True)
+    for customer_id, _, event_id, evt_doc, _ in items:
+        evt_ref = cust_refs[customer_id].collection("events").document(event_id)
+        batch.set(evt_ref, evt_doc, merge=True)
+    batch.commit()
+    return len(customers)
+
+
+def _commit_snapshots(items: List[SnapshotWrite]) -> None:
     """
-    log = logging.getLogger("uvicorn.error")
-    db = get_firestore_client()
+    Commit queued snapshots in size-capped WriteBatches (blocking; run in a thread).
+    A WriteBatch is all-or-nothing, so a failed batch is retried one customer at a
+    time: a bad write only loses that customer's events, not the whole flush.
+    """
+    for batch_items in _split_snapshot_batches(items):
+        try:
+            customers = _write_snapshot_batch(batch_items)
+            log.info("🟩 Firestore write OK: %d events for %d customers", len(batch_items), customers)
+            continue
+        except Exception as e:
+            log.warning("🟨 Firestore batch of %d events failed, retrying per customer: %s", len(batch_items), e)
+
+        by_customer: Dict[str, List[SnapshotWrite]] = {}
+        for item in batch_items:
+            by_customer.setdefault(item[0], []).append(item)
+        for customer_id, customer_items in by_customer.items():
+            try:
+                _write_snapshot_batch(customer_items)
+            except gcloud_exceptions.GoogleAPIError as ge:
+                log.exception(
+                    "🟥 Firestore API error for customer %s (%d events): %s",
+                    customer_id, len(customer_items), ge,
+                )
+            except Exception as e:
+                log.exception(
+                    "🟥 Firestore write unexpected error for customer %s (%d events): %s",
+                    customer_id, len(customer_items), e,
+                )
+
+
+async def drain_snapshot_queue(snapshots: SnapshotQueue) -> None:
+    """Flush queued snapshots every _FLUSH_INTERVAL_SECONDS or _FLUSH_MAX_EVENTS, whichever comes first."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await snapshots.get()]
+        deadline = loop.time() + _FLUSH_INTERVAL_SECONDS
+        try:
+            while len(items) < _FLUSH_MAX_EVENTS:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(snapshots.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            # Also runs on cancellation (shutdown) so collected items aren't dropped
+            await asyncio.to_thread(_commit_snapshots, items)
+
+
+async def flush_snapshot_queue(snapshots: SnapshotQueue) -> None:
+    """Commit whatever is still queued (used on shutdown)."""
+    while not snapshots.empty():
+        items: List[SnapshotWrite] = []
+        while len(items) < _FLUSH_MAX_EVENTS and not snapshots.empty():
+            items.append(snapshots.get_nowait())
+        await asyncio.to_thread(_commit_snapshots, items)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # uvicorn's loop="auto" (also used by UvicornWorker) picks uvloop when installed
+    log.info("Event loop: %s", type(asyncio.get_running_loop()).__module__)
+    await register_google_oauth()
+    app.state.snapshot_queue = asyncio.Queue(maxsize=SNAPSHOT_QUEUE_MAXSIZE)
+    drainer = asyncio.create_task(drain_snapshot_queue(app.state.snapshot_queue))
+    # Bounded queue + fixed worker pool for verified Stripe events
+    app.state.event_queue = asyncio.Queue(maxsize=EVENT_QUEUE_MAXSIZE)
+    dropped: List[bytes] = []
+    workers = [
+        asyncio.create_task(event_worker(app.state.event_queue, app.state.snapshot_queue, dropped))
+        for _ in range(EVENT_WORKERS)
+    ]
+    open_stripe_http_client()
+    # Fire-and-forget: don't hold up startup on a Stripe round trip
+    stripe_warmup = asyncio.create_task(warm_stripe_client())
+    try:
+        yield
+    finally:
+        stripe_warmup.cancel()
+        # Let queued events finish (they enqueue snapshot writes) before flushing
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(app.state.event_queue.join(), EVENT_DRAIN_TIMEOUT_SECONDS)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        while not app.state.event_queue.empty():
+            dropped.append(app.state.event_queue.get_nowait())
+        await release_dropped_events(app, dropped)
+        drainer.cancel()
+        with suppress(asyncio.CancelledError):
+            await drainer
+        await flush_snapshot_queue(app.state.snapshot_queue)
+        await close_async_search_clients()
+        await close_stripe_http_client()
+        await close_redis()
 
-    # document paths
-    cust_ref = db.collection("subscriptions").document(customer_id)
 
-    # We’ll store the 'raw' under events with the Stripe event id if present
-    event_id = raw.get("id") or raw.get("latest_invoice") or "no_event_id"
-    evt_ref = cust_ref.collection("events").document(str(event_id))
+# -----------------------------
+# Stripe HTTP client
+# -----------------------------
+# One persistent httpx-backed client (sync + async pools) for any outbound Stripe
+# API call, so calls to api.stripe.com reuse keep-alive connections. Opened and
+# closed with the app (see lifespan).
+stripe.max_network_retries = 2
+
+
+def open_stripe_http_client() -> None:
+    stripe.default_http_client = stripe.HTTPXClient(timeout=5, allow_sync_methods=True)
+
+
+async def close_stripe_http_client() -> None:
+    client = stripe.default_http_client
+    stripe.default_http_client = None
+    if isinstance(client, stripe.HTTPXClient):
+        client.close()
+        await client.close_async()
 
+
+async def warm_stripe_client() -> None:
+    """Open the connection to api.stripe.com before the first handler needs it."""
+    if not stripe.api_key:
+        return
     try:
-        db.batch()\
-          .set(cust_ref, {
-              "email": email,
-              "lastSubscriptionId": subscription_id,
-              "lastStatus": status,
-              "updatedAt": firestore.SERVER_TIMESTAMP,
-          }, merge=True)\
-          .set(evt_ref, {"raw": raw, "createdAt": firestore.SERVER_TIMESTAMP}, merge=True)\
-          .commit()
-
-        log.info("🟩 Firestore write OK for customer %s (sub=%s, status=%s)", customer_id, subscription_id, status)
-    except gcloud_exceptions.GoogleAPIError as ge:
-        log.exception("🟥 Firestore API error: %s", ge)
+        await stripe.Account.retrieve_async()
+        log.info("Stripe HTTP client warmed up")
     except Exception as e:
-        log.exception("🟥 Firestore write unexpected error: %s", e)
+        log.warning("Stripe warm-up failed: %s", e)
+
+
+# -----------------------------
+# Stripe signature verification
+# -----------------------------
+STRIPE_SIGNATURE_TOLERANCE_SECONDS = 300
+MAX_WEBHOOK_BODY_BYTES = 512 * 1024  # well above real Stripe payloads; caps memory per request
+
+
+def start_stripe_signature(
+    sig_header: str,
+    secret: bytes,
+    tolerance: int = STRIPE_SIGNATURE_TOLERANCE_SECONDS,
+) -> Optional[Tuple["hmac.HMAC", List[str]]]:
+    """
+    Parse a Stripe-Signature header (t=<ts>,v1=<hex>[,v1=<hex>...]) and return an
+    HMAC-SHA256 already fed the "<t>." prefix, plus the expected v1 signatures.
+    Same scheme as stripe.Webhook.construct_event; the caller streams the raw body
+    into the MAC and checks it with stripe_signature_matches.
+    Returns None if the header is malformed or outside the tolerance window.
+    """
+    timestamp = ""
+    signatures: List[str] = []
+    for part in sig_header.split(","):
+        key, _, value = part.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+    if not timestamp.isdigit() or not signatures:
+        return None
+    if tolerance and int(timestamp) < time.time() - tolerance:
+        return None
+    return hmac.new(secret, timestamp.encode() + b".", hashlib.sha256), signatures
+
+
+def stripe_signature_matches(mac: "hmac.HMAC", signatures: List[str]) -> bool:
+    expected = mac.hexdigest()
+    return any(hmac.compare_digest(expected, s) for s in signatures)
+
+
+# -----------------------------
+# Stripe event handlers
+# -----------------------------
+async def handle_checkout_completed(
+    session: CheckoutSession, payload: bytes, snapshots: SnapshotQueue
+) -> None:
+    email = session.customer_details.email if session.customer_details else None
+    customer_id = session.customer
+    subscription_id = session.subscription
+    status = (session.status or "").lower()  # often "complete"
+    log.info("✅ Checkout completed: email=%s, customer=%s, sub=%s", email, customer_id, subscription_id)
+
+    if customer_id:
+        await write_customer_subscription_snapshot(
+            snapshots,
+            customer_id=customer_id,
+            email=email,
+            subscription_id=subscription_id,
+            status=status,
+            raw=payload,
+        )
+
+
+async def handle_subscription_updated(
+    data: Union[Subscription, Invoice], payload: bytes, snapshots: SnapshotQueue
+) -> None:
+    # subscription object shape
+    customer_id = data.customer
+    subscription_id = data.id
+    status = data.status
+    log.info("🔄 Subscription update: customer=%s, sub=%s, status=%s", customer_id, subscription_id, status)
+
+    # Try to grab email if present via default_payment_method.billing_details.email
+    email = None
+    pm = data.default_payment_method
+    if isinstance(pm, PaymentMethod) and pm.billing_details:
+        email = pm.billing_details.email
+
+    if customer_id:
+        await write_customer_subscription_snapshot(
+            snapshots,
+            customer_id=customer_id,
+            email=email,
+            subscription_id=subscription_id,
+            status=status,
+            raw=payload,
+        )
+
+
+# Routing table built once at import; everything not in it is acknowledged without work.
+HANDLERS: Dict[str, Callable[[Any, bytes, SnapshotQueue], Awaitable[None]]] = {
+    "checkout.session.completed": handle_checkout_completed,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.created": handle_subscription_updated,
+    "invoice.payment_succeeded": handle_subscription_updated,
+    "invoice.payment_failed": handle_subscription_updated,
+}
+HANDLED_TYPES = frozenset(HANDLERS)
+# Quoted type names, for a substring pre-check on the raw body before any parsing
+HANDLED_TYPE_TOKENS = tuple(f'"{t}"'.encode() for t in HANDLED_TYPES)
+
+
+async def process_event(payload: bytes, snapshots: SnapshotQueue) -> None:
+    """Dispatch a verified, deduplicated event to its handler (runs after the 200 is sent)."""
+    try:
+        event = decode_event(payload)
+    except msgspec.ValidationError as e:
+        log.exception("⚠️ Unexpected Stripe event shape: %s", e)
+        return
+    log.info("🎯 Stripe event received: %s", event.type)
+    await HANDLERS[event.type](event.data.object, payload, snapshots)
+
+
+EVENT_QUEUE_MAXSIZE = 1000
+EVENT_WORKERS = 8
+EVENT_DRAIN_TIMEOUT_SECONDS = 10
+EVENT_TTL_SECONDS = 86400
+
+
+def _dedupe_key(event_id: str) -> str:
+    return f"stripe:evt:{event_id}"
+
+
+async def release_event_id(app: FastAPI, event_id: str) -> None:
+    """Forget a recorded event id so Stripe's next retry of it gets processed."""
+    r = get_redis()
+    if r is not None:
+        await r.delete(_dedupe_key(event_id))
+    else:
+        app.state.seen_events.pop(event_id, None)
+
+
+async def event_worker(
+    queue: "asyncio.Queue[bytes]", snapshots: SnapshotQueue, dropped: List[bytes]
+) -> None:
+    """
+    Process queued webhook payloads one at a time; EVENT_WORKERS of these run per process.
+    A payload interrupted by cancellation (shutdown) is appended to `dropped`.
+    """
+    while True:
+        payload = await queue.get()
+        try:
+            await process_event(payload, snapshots)
+        except asyncio.CancelledError:
+            dropped.append(payload)
+            raise
+        except Exception as e:
+            log.exception("⚠️ Stripe event handler error: %s", e)
+        finally:
+            queue.task_done()
+
+
+async def release_dropped_events(app: FastAPI, dropped: List[bytes]) -> None:
+    """
+    Shutdown path for events that were acked but never processed: release their
+    dedupe keys so Stripe's retries are not ignored as duplicates.
+    """
+    if not dropped:
+        return
+    for payload in dropped:
+        event_id = decode_header(payload).id
+        try:
+            await release_event_id(app, event_id)
+        except Exception as e:
+            log.warning("⚠️ Could not release Stripe event %s: %s", event_id, e)
+    log.warning(
+        "⚠️ Dropped %d unprocessed Stripe event(s) on shutdown; released their ids for retry",
+        len(dropped),
+    )
 
 
 # -----------------------------
 # App factory
 # -----------------------------
+SESSION_LIFETIME_SECONDS = 14 * 24 * 3600  # same as Starlette's cookie max_age
+# Paths that get session middleware: the Google OAuth router (/v1/auth/...) and every
+# route that depends on require_user (search_admin, search_ingest). A new router
+# that reads request.session must add its prefix here; require_user fails loudly
+# if it runs without one.
+SESSION_PATH_PREFIXES = ("/v1/auth/", "/v1/search/admin/")
+_HEALTH_RESPONSE = Response(content=b'{"status":"ok"}', media_type="application/json")
+
 def create_app() -> FastAPI:
     setup_logging()
     settings = get_settings()
 
-    app = FastAPI(title=settings.app_name)
-    log = logging.getLogger("uvicorn.error")
+    app = FastAPI(title=settings.app_name, default_response_class=ORJSONResponse, lifespan=lifespan)
 
     # --- CORS ---
-    origins = [o.strip() for o in settings.cors_origins.split(",") if o.strip()]
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=["*"] if "*" in origins else origins,
+        allow_origins=["*"] if settings.allow_all_origins else list(settings.cors_origins_list),
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
     )
 
     # --- Session Middleware (for Google OAuth) ---
-    if not settings.app_session_secret:
-        raise RuntimeError("APP_SESSION_SECRET is not set.")
-    app.add_middleware(SessionMiddleware, secret_key=settings.app_session_secret)
-
-    # --- Mask Secrets Dependency ---
-    def secret_dep() -> dict[str, str | None]:
-        s = get_settings()
-        return {
-            "openai_api_key": s.openai_api_key,
-            "stripe_secret_key": s.stripe_secret_key,
-            "google_client_id": s.google_client_id,
-            "google_client_secret": s.google_client_secret,
-            "azure_search_endpoint": s.azure_search_endpoint,
-            "azure_search_key": "present" if s.azure_search_key else None,
-        }
+    # With Redis, the cookie only carries an opaque session id and the profile
+    # lives server-side; otherwise fall back to Starlette's signed-cookie sessions.
+    # Only mounted on the paths that read the session (OAuth + require_user routes),
+    # so the webhook, search and health never touch the cookie.
+    redis_client = get_redis()
+    if redis_client is not None:
+        store = RedisStore(connection=redis_client, prefix="sess:")
+
+        def session_middleware(inner: ASGIApp) -> ASGIApp:
+            return RedisSessionMiddleware(
+                SessionAutoloadMiddleware(inner),
+                store=store,
+                lifetime=SESSION_LIFETIME_SECONDS,
+                cookie_https_only=False,
+            )
+    else:
+        if not settings.app_session_secret:
+            raise RuntimeError("APP_SESSION_SECRET is not set.")
+        session_secret = settings.app_session_secret
+
+        def session_middleware(inner: ASGIApp) -> ASGIApp:
+            return SessionMiddleware(inner, secret_key=session_secret)
+
+    app.add_middleware(PathScopedMiddleware, middleware=session_middleware, prefixes=SESSION_PATH_PREFIXES)
 
     # --- Include Routers ---
-    app.include_router(v1_router, prefix="/v1", dependencies=[Depends(secret_dep)])
+    app.include_router(v1_router, prefix="/v1")
     app.include_router(google_router, prefix="/v1")
     app.include_router(search_admin_router, prefix="/v1")
     app.include_router(search_public_router, prefix="/v1")
@@ -152,109 +536,107 @@ def create_app() -> FastAPI:
     # -------------------------------------------------------------------------
     # Stripe Webhook — with Firestore integration
     # -------------------------------------------------------------------------
-    stripe.api_key = os.getenv("STRIPE_API_KEY", "")
-    WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
-    seen_events: set[str] = set()  # simple in-memory idempotency
-
-    async def handle_checkout_completed(data: Dict[str, Any], full_event: Dict[str, Any]) -> None:
-        email = (data.get("customer_details") or {}).get("email")
-        customer_id = data.get("customer")
-        subscription_id = data.get("subscription")
-        status = (data.get("status") or "").lower()  # often "complete"
-        log.info("✅ Checkout completed: email=%s, customer=%s, sub=%s", email, customer_id, subscription_id)
-
-        if customer_id:
-            write_customer_subscription_snapshot(
-                customer_id=customer_id,
-                email=email,
-                subscription_id=subscription_id,
-                status=status,
-                raw=full_event,
-            )
-
-    async def handle_subscription_updated(data: Dict[str, Any], full_event: Dict[str, Any]) -> None:
-        # subscription object shape
-        customer_id = data.get("customer")
-        subscription_id = data.get("id")
-        status = data.get("status")
-        log.info("🔄 Subscription update: customer=%s, sub=%s, status=%s", customer_id, subscription_id, status)
-
-        # Try to grab email if present via default_payment_method.billing_details.email
-        email = None
-        if isinstance(data.get("default_payment_method"), dict):
-            pm = data["default_payment_method"]
-            email = (pm.get("billing_details") or {}).get("email")
-
-        if customer_id:
-            write_customer_subscription_snapshot(
-                customer_id=customer_id,
-                email=email,
-                subscription_id=subscription_id,
-                status=status,
-                raw=full_event,
-            )
-
-    def route_event(event_type: str):
-        return {
-            "checkout.session.completed": handle_checkout_completed,
-            "customer.subscription.updated": handle_subscription_updated,
-            "customer.subscription.created": handle_subscription_updated,
-            "invoice.payment_succeeded": handle_subscription_updated,
-            "invoice.payment_failed": handle_subscription_updated,
-        }.get(event_type)
+    stripe.api_key = settings.stripe_api_key
+    WEBHOOK_SECRET_BYTES = settings.stripe_webhook_secret.encode()  # encoded once, not per event
+    # In-memory fallback when Redis is not configured; bounded so it can't grow forever
+    app.state.seen_events = TTLCache(maxsize=10_000, ttl=EVENT_TTL_SECONDS)
 
     @app.post("/v1/billing/webhook", include_in_schema=True)
     @app.post("/v1/billing/webhook/", include_in_schema=True)
-    async def stripe_webhook(request: Request, background: BackgroundTasks):
-        """Main Stripe webhook endpoint"""
-        if not WEBHOOK_SECRET:
+    async def stripe_webhook(request: Request):
+        """
+        Main Stripe webhook endpoint.
+
+        Idempotency: event ids are recorded in Redis (SET NX, 24h TTL) so retries are
+        deduplicated across workers. Without Redis, a per-process TTL/LRU cache is used:
+        memory stays flat, but an id evicted early (cache full) or seen by another
+        worker can be processed twice.
+        """
+        if not WEBHOOK_SECRET_BYTES:
             log.error("❌ STRIPE_WEBHOOK_SECRET missing in environment")
             raise HTTPException(status_code=500, detail="Webhook not configured")
 
-        payload = await request.body()
         sig = request.headers.get("stripe-signature")
         if not sig:
             raise HTTPException(status_code=400, detail="Missing Stripe-Signature header")
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > MAX_WEBHOOK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
 
-        try:
-            event = stripe.Webhook.construct_event(payload, sig, WEBHOOK_SECRET)
-        except stripe.error.SignatureVerificationError:
+        started = start_stripe_signature(sig, WEBHOOK_SECRET_BYTES)
+        if started is None:
             raise HTTPException(status_code=400, detail="Invalid signature")
-        except Exception as e:
+        mac, signatures = started
+
+        # Hash the body as it arrives, with a hard size cap (Content-Length may be absent)
+        body = bytearray()
+        async for chunk in request.stream():
+            if len(body) + len(chunk) > MAX_WEBHOOK_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Payload too large")
+            mac.update(chunk)
+            body += chunk
+        if not stripe_signature_matches(mac, signatures):
+            raise HTTPException(status_code=400, detail="Invalid signature")
+        payload = bytes(body)
+
+        # A handled event must contain its quoted type name somewhere in the body; if
+        # none appear, ack without parsing. Hits may be false positives (the name
+        # showing up inside data), so they still go through the header decode below.
+        if not any(token in payload for token in HANDLED_TYPE_TOKENS):
+            return ORJSONResponse({"received": True})
+
+        try:
+            header = decode_header(payload)
+        except msgspec.DecodeError as e:
             log.exception("⚠️ Webhook parse error: %s", e)
             raise HTTPException(status_code=400, detail="Invalid payload")
 
-        event_id = event.get("id")
-        event_type = event.get("type")
-        data = (event.get("data") or {}).get("object") or {}
+        # Most Stripe traffic is for types we don't handle: ack those right away,
+        # without touching the dedupe store.
+        if header.type not in HANDLED_TYPES:
+            log.info("No handler for event type %s", header.type)
+            return ORJSONResponse({"received": True})
 
-        # Idempotency check
-        if event_id in seen_events:
-            log.info("🔁 Duplicate Stripe event ignored: %s", event_id)
-            return {"received": True, "duplicate": True}
-        seen_events.add(event_id)
+        event_id = header.id
 
-        log.info("🎯 Stripe event received: %s", event_type)
-        handler = route_event(event_type)
-        if handler:
-            background.add_task(handler, data, event)
+        # Idempotency check (cluster-wide via Redis SET NX EX)
+        r = get_redis()
+        if r is not None:
+            added = await r.set(_dedupe_key(event_id), "1", nx=True, ex=EVENT_TTL_SECONDS)
+            duplicate = added is None
         else:
-            log.info("No handler for event type %s", event_type)
-
-        return {"received": True}
-
-    # Health
-    @app.get("/health")
-    def health():
-        return {"status": "ok"}
-
-    # Route log on startup (nice for sanity)
-    @app.on_event("startup")
-    async def log_routes():
-        for route in app.router.routes:
-            methods = getattr(route, "methods", [])
-            path = getattr(route, "path", "")
-            log.info("ROUTE %s %s", ",".join(sorted(methods)), path)
+            seen_events = request.app.state.seen_events
+            duplicate = event_id in seen_events
+            seen_events[event_id] = True
+        if duplicate:
+            log.info("🔁 Duplicate Stripe event ignored: %s", event_id)
+            return ORJSONResponse({"received": True, "duplicate": True})
+
+        try:
+            request.app.state.event_queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Backpressure: forget the id and let Stripe retry later
+            await release_event_id(request.app, event_id)
+            log.warning("⚠️ Stripe event queue full, rejecting %s", event_id)
+            raise HTTPException(status_code=503, detail="Busy, retry later")
+
+        return ORJSONResponse({"received": True})
+
+    # Health — plain Starlette route returning a pre-built response: no FastAPI
+    # dependency resolution or serialization on the hottest route
+    async def health(request: Request) -> Response:
+        return _HEALTH_RESPONSE
+
+    app.add_route("/health", health, methods=["GET"])
+
+    # Route log (nice for sanity) — one record for the whole table, at build time.
+    # The table is formatted eagerly, so skip building it when INFO is filtered out.
+    if log.isEnabledFor(logging.INFO):
+        lines = [
+            f"{','.join(sorted(getattr(r, 'methods', None) or ()))} {getattr(r, 'path', '')}"
+            for r in app.router.routes
+        ]
+        log.info("ROUTES:\n%s", "\n".join(lines))
 
     return app
 
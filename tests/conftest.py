@@ -0,0 +1,7 @@
+import os
+
+# app.main builds the app at import time; give it the settings it needs and keep
+# it off any Redis configured in the environment.
+os.environ.setdefault("APP_SESSION_SECRET", "test-session-secret")
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_test")
+os.environ.pop("REDIS_URL", None)
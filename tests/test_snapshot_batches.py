@@ -0,0 +1,45 @@
+"""Size-capped Firestore batching and the per-customer fallback in _commit_snapshots."""
+from typing import List
+
+import app.main as main
+from app.main import SnapshotWrite
+
+
+def item(customer_id: str, event_id: str, size: int) -> SnapshotWrite:
+    return (customer_id, {"lastStatus": "active"}, event_id, {"raw": {}}, size)
+
+
+def test_batches_are_capped_by_bytes():
+    big = main.MAX_WEBHOOK_BODY_BYTES
+    items = [item("cus_1", f"evt_{i}", big) for i in range(40)]
+    batches = main._split_snapshot_batches(items)
+    assert [i for b in batches for i in b] == items
+    assert len(batches) > 1
+    assert all(sum(i[4] for i in b) <= main._FLUSH_MAX_BYTES for b in batches)
+
+
+def test_batches_are_capped_by_event_count():
+    items = [item("cus_1", f"evt_{i}", 10) for i in range(main._FLUSH_MAX_EVENTS + 1)]
+    batches = main._split_snapshot_batches(items)
+    assert [len(b) for b in batches] == [main._FLUSH_MAX_EVENTS, 1]
+
+
+def test_oversized_item_gets_its_own_batch():
+    items = [item("cus_1", "evt_small", 10), item("cus_1", "evt_huge", main._FLUSH_MAX_BYTES + 1)]
+    assert main._split_snapshot_batches(items) == [[items[0]], [items[1]]]
+
+
+def test_failed_batch_falls_back_to_per_customer(monkeypatch):
+    committed: List[List[SnapshotWrite]] = []
+
+    def write(items: List[SnapshotWrite]) -> int:
+        customers = {i[0] for i in items}
+        if len(customers) > 1 or customers == {"cus_bad"}:
+            raise RuntimeError("rejected")
+        committed.append(items)
+        return 1
+
+    monkeypatch.setattr(main, "_write_snapshot_batch", write)
+    items = [item("cus_1", "evt_1", 10), item("cus_bad", "evt_2", 10), item("cus_2", "evt_3", 10)]
+    main._commit_snapshots(items)
+    assert committed == [[items[0]], [items[2]]]
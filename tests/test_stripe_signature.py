@@ -0,0 +1,139 @@
+"""
+start_stripe_signature / stripe_signature_matches must accept and reject exactly
+what stripe.WebhookSignature.verify_header does.
+"""
+import hashlib
+import hmac
+import time
+
+import pytest
+import stripe
+from fastapi.testclient import TestClient
+
+from app.core.config import get_settings
+from app.main import (
+    MAX_WEBHOOK_BODY_BYTES,
+    STRIPE_SIGNATURE_TOLERANCE_SECONDS,
+    create_app,
+    start_stripe_signature,
+    stripe_signature_matches,
+)
+
+SECRET = "whsec_test"
+PAYLOAD = '{"id":"evt_1","type":"customer.subscription.updated","data":{"object":{}}}'
+
+
+def sign(payload: str, timestamp: int, secret: str = SECRET) -> str:
+    signed = f"{timestamp}.{payload}".encode()
+    return hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+
+
+def ours(payload: str, header: str, secret: str = SECRET) -> bool:
+    started = start_stripe_signature(header, secret.encode())
+    if started is None:
+        return False
+    mac, signatures = started
+    mac.update(payload.encode())
+    return stripe_signature_matches(mac, signatures)
+
+
+def stripes(payload: str, header: str, secret: str = SECRET) -> bool:
+    try:
+        return stripe.WebhookSignature.verify_header(
+            payload, header, secret, tolerance=STRIPE_SIGNATURE_TOLERANCE_SECONDS
+        )
+    except stripe.error.SignatureVerificationError:
+        return False
+
+
+def now() -> int:
+    return int(time.time())
+
+
+# Each case gets one timestamp, shared by t= and the signature it covers
+CASES = {
+    "valid": lambda ts: (PAYLOAD, f"t={ts},v1={sign(PAYLOAD, ts)}", SECRET),
+    "tampered_body": lambda ts: (PAYLOAD.replace("evt_1", "evt_2"), f"t={ts},v1={sign(PAYLOAD, ts)}", SECRET),
+    "wrong_secret": lambda ts: (PAYLOAD, f"t={ts},v1={sign(PAYLOAD, ts, 'whsec_other')}", SECRET),
+    "stale_timestamp": lambda ts: (
+        PAYLOAD,
+        f"t={ts - STRIPE_SIGNATURE_TOLERANCE_SECONDS - 60},"
+        f"v1={sign(PAYLOAD, ts - STRIPE_SIGNATURE_TOLERANCE_SECONDS - 60)}",
+        SECRET,
+    ),
+    "timestamp_within_tolerance": lambda ts: (
+        PAYLOAD,
+        f"t={ts - STRIPE_SIGNATURE_TOLERANCE_SECONDS + 60},"
+        f"v1={sign(PAYLOAD, ts - STRIPE_SIGNATURE_TOLERANCE_SECONDS + 60)}",
+        SECRET,
+    ),
+    "signed_with_other_timestamp": lambda ts: (PAYLOAD, f"t={ts},v1={sign(PAYLOAD, ts - 1)}", SECRET),
+    "malformed_garbage": lambda ts: (PAYLOAD, "garbage", SECRET),
+    "malformed_empty": lambda ts: (PAYLOAD, "", SECRET),
+    "malformed_timestamp": lambda ts: (PAYLOAD, f"t=abc,v1={sign(PAYLOAD, ts)}", SECRET),
+    "missing_timestamp": lambda ts: (PAYLOAD, f"v1={sign(PAYLOAD, ts)}", SECRET),
+    "missing_v1": lambda ts: (PAYLOAD, f"t={ts}", SECRET),
+    "only_v0": lambda ts: (PAYLOAD, f"t={ts},v0={sign(PAYLOAD, ts)}", SECRET),
+    "several_v1_one_correct": lambda ts: (
+        PAYLOAD,
+        f"t={ts},v1={'0' * 64},v1={sign(PAYLOAD, ts)},v1={sign(PAYLOAD, ts, 'whsec_other')}",
+        SECRET,
+    ),
+    "several_v1_none_correct": lambda ts: (
+        PAYLOAD,
+        f"t={ts},v1={'0' * 64},v1={sign(PAYLOAD, ts, 'whsec_other')}",
+        SECRET,
+    ),
+}
+
+EXPECTED_VALID = {"valid", "timestamp_within_tolerance", "several_v1_one_correct"}
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_matches_stripe_sdk(case):
+    payload, header, secret = CASES[case](now())
+    expected = stripes(payload, header, secret)
+    assert expected is (case in EXPECTED_VALID)
+    assert ours(payload, header, secret) is expected
+
+
+def test_body_can_be_fed_in_chunks():
+    ts = now()
+    started = start_stripe_signature(f"t={ts},v1={sign(PAYLOAD, ts)}", SECRET.encode())
+    assert started is not None
+    mac, signatures = started
+    raw = PAYLOAD.encode()
+    for i in range(0, len(raw), 7):
+        mac.update(raw[i : i + 7])
+    assert stripe_signature_matches(mac, signatures)
+
+
+@pytest.fixture
+def client():
+    assert get_settings().stripe_webhook_secret == SECRET
+    # No lifespan: both 413 paths reject before anything is enqueued
+    return TestClient(create_app())
+
+
+def test_rejects_oversized_content_length(client):
+    body = b"x" * (MAX_WEBHOOK_BODY_BYTES + 1)
+    resp = client.post(
+        "/v1/billing/webhook",
+        content=body,
+        headers={"Stripe-Signature": f"t={now()},v1={'0' * 64}"},
+    )
+    assert resp.status_code == 413
+
+
+def test_rejects_oversized_stream_without_content_length(client):
+    def chunks():
+        chunk = b"x" * 64 * 1024
+        for _ in range(MAX_WEBHOOK_BODY_BYTES // len(chunk) + 1):
+            yield chunk
+
+    resp = client.post(
+        "/v1/billing/webhook",
+        content=chunks(),
+        headers={"Stripe-Signature": f"t={now()},v1={'0' * 64}"},
+    )
+    assert resp.status_code == 413